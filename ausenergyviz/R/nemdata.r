@@ -25,6 +25,7 @@ function(base_path) {
     class(self) <- "nemdata"
     self$dispatch_cdf <- paste(base_path, "/cdf/dispatch.cdf", sep="")
     self$generator_csv <- paste(base_path, "/AEMO_GENERATORS.csv", sep="")
+    self$view_cache <- paste(base_path, "/cdf/views.csv.gz", sep="")
     self$timescales <- list()
     self$timescales[["5min"]] <- as.difftime(5, units="mins")
     self$timescales[["30min"]] <- as.difftime(30, units="mins")
@@ -132,22 +133,72 @@ function(self, generator_ids, dt_start, dt_finish, timescale="5min") {
     }
     time <- seq(dt_start, dt_finish, self$timescales[[timescale]])
     if (is.null(generator_ids)) generator_ids <- row.names(self$generator_ids)
+    gen_nums <- self$generator_ids[generator_ids,]
     df <- matrix(nrow=npoints, ncol=length(generator_ids))
     colnames(df) <- generator_ids
+    df[,!is.na(gen_nums)] <- 0
     
     nc <- nc_open(self$dispatch_cdf)
-    coldata <- ncvar_get(nc, paste("dispatch_", timescale, sep=""), 
-                           start=c(1, start), count=c(self$num_gens, npoints))
+    # skip generators the activity index shows had no output in this range
+    active <- !is.na(gen_nums)
+    if ("gen_first_active" %in% names(nc$var)) {
+        per_record <- as.numeric(self$timescales[[timescale]], units="mins") / 5
+        first_active <- ncvar_get(nc, "gen_first_active")[gen_nums]
+        last_active <- ncvar_get(nc, "gen_last_active")[gen_nums]
+        active <- active & first_active < finish * per_record &
+            last_active >= (start - 1) * per_record
+        active[is.na(active)] <- FALSE
+    }
+    if (any(active)) {
+        lo <- min(gen_nums[active])
+        hi <- max(gen_nums[active])
+        coldata <- ncvar_get(nc, paste("dispatch_", timescale, sep=""), 
+                             start=c(lo, start), count=c(hi - lo + 1, npoints),
+                             collapse_degen=FALSE)
+        df[,active] <- t(coldata[gen_nums[active] - lo + 1, , drop=FALSE])
+    }
     nc_close(nc)
     
-    for (gen_id in generator_ids) {
-        gen_num <- self$generator_ids[gen_id,]
-        df[,gen_id] <- coldata[gen_num,]
-    }
     df <- data.table(time=time, df, check.names=FALSE)
     df
 }
 
+# returns pre-aggregated output by region and fuel for one of the default
+# views written by import_aemo.py, or NULL if the cache has no entry for
+# exactly this date range and timescale, or is older than the CDF file
+nemdata_fetch_view <-
+function(self, date_start, date_finish, timescale="5min") {
+    if (!file.exists(self$view_cache) ||
+        file.mtime(self$view_cache) < file.mtime(self$dispatch_cdf)) {
+        return (NULL)
+    }
+    lines <- tryCatch(readLines(gzfile(self$view_cache)), error=function(e) NULL)
+    if (is.null(lines)) {
+        return (NULL)
+    }
+    # each view is a "#view,name,timescale,start,finish" line followed by a
+    # table with a time column and one REGION.FUEL column per series
+    starts <- grep("^#view,", lines)
+    headers <- strsplit(lines[starts], ",", fixed=TRUE)
+    match <- which(vapply(headers, function(h)
+        h[3] == timescale && h[4] == as.character(date_start) &&
+        h[5] == as.character(date_finish), logical(1)))
+    if (length(match) < 1) {
+        return (NULL)
+    }
+    first <- starts[match[1]] + 1
+    last <- if (match[1] < length(starts)) starts[match[1] + 1] - 1 else length(lines)
+    view <- read.csv(text=lines[first:last], check.names=FALSE, stringsAsFactors=FALSE)
+    series <- strsplit(names(view)[-1], ".", fixed=TRUE)
+    data.table(
+        time = rep(as.POSIXct(view$time, tz=nemdata_timezone), length(series)),
+        region = ordered(rep(sapply(series, "[", 1), each=nrow(view)),
+                         levels=levels(self$generator_info$region)),
+        fuel = ordered(rep(sapply(series, "[", 2), each=nrow(view)),
+                       levels=levels(self$generator_info$fuel)),
+        output = unlist(view[-1], use.names=FALSE))
+}
+
 nemdata_generators_by_state <-
 function(self, state) {
     self$generator_info$id[self$generator_info$region == state]
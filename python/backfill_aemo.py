@@ -0,0 +1,236 @@
+#!/usr/bin/env python2
+#
+# backfill_aemo.py: find gaps in the dispatch CDF and fetch only the AEMO
+# zip files needed to fill them.
+#
+# Copyright (c) 2014 Cameron Patrick <cameron@largestprime.net>
+#
+# This file is part of AusEnergyViz. AusEnergyViz is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, see <http://www.gnu.org/licenses/>.
+
+import bisect
+import datetime
+import os
+import re
+import sys
+import argparse
+
+from download_aemo import URL_DISPATCH_ARCHIVE, URL_DISPATCH_CURRENT, \
+    archive_zip_name, fetch_aemo_zip_list, fetch_aemo_zip
+from import_aemo import AemoCDF, load_dispatch_zip, lock_cdf, begin_update, \
+    publish_update, discard_update, refresh_view_cache
+
+# a daily archive zip for a given date holds the 5 minute records from 00:10
+# on that date to 00:05 on the next (see AemoCDF.have_date_data)
+ARCHIVE_FIRST_RECORD = 2
+RECORDS_PER_DAY = 288
+
+def archive_day_for_record(record_num):
+    """Returns the day number (relative to the CDF start date) of the daily
+    archive zip containing a given 5 minute record."""
+    return (record_num - ARCHIVE_FIRST_RECORD) // RECORDS_PER_DAY
+
+def archive_day_records(day):
+    """Returns the (first, last) record numbers covered by a daily archive."""
+    first = day*RECORDS_PER_DAY + ARCHIVE_FIRST_RECORD
+    return (first, first + RECORDS_PER_DAY - 1)
+
+def current_zip_record_num(z, cdf):
+    """Returns the record number of a 'long' 5 minute dispatch zip name, or
+    None if it can't be parsed."""
+    date_match = re.search(r'(?i)_([0-9_]+).zip', z)
+    if date_match is None:
+        return None
+    date_str = date_match.group(1)
+    if len(date_str) < 12:
+        return None
+    dt = datetime.datetime(int(date_str[0:4]), int(date_str[4:6]), int(date_str[6:8]),
+                           int(date_str[8:10]), int(date_str[10:12]), 0)
+    return cdf.record_num_for(dt)
+
+def plan_backfill(cdf, gaps, archive_list, current_list):
+    """Works out which zip files are needed to fill a list of gaps.
+
+    Daily archives are preferred wherever AEMO still has them; individual 5
+    minute zips are only used for records not covered by an archive.
+
+    Args:
+        cdf: the AemoCDF object the gaps were found in
+        gaps: list of (first, last) record number pairs from missing_ranges
+        archive_list: zip names listed in the AEMO archive folder
+        current_list: zip names listed in the AEMO current folder
+
+    Returns:
+        a tuple (archive_zips, current_zips, unfilled) where the first two
+        are sorted lists of zip names to fetch and unfilled is a list of
+        (first, last) record number pairs that no listed zip can fill.
+    """
+    archive_names = dict((z.upper(), z) for z in archive_list)
+    start_day = cdf.start_date.date()
+
+    # map each gap to the daily archives spanning it
+    archive_zips = set()
+    remaining = []
+    for first, last in gaps:
+        for day in xrange(archive_day_for_record(first), archive_day_for_record(last) + 1):
+            date = start_day + datetime.timedelta(days=day)
+            name = archive_zip_name(date.strftime('%Y%m%d'))
+            day_first, day_last = archive_day_records(day)
+            lo = max(first, day_first)
+            hi = min(last, day_last)
+            if name in archive_names:
+                archive_zips.add(archive_names[name])
+            else:
+                remaining.append((lo, hi))
+
+    # pick out any 5 minute zips falling inside what's left
+    current_zips = set()
+    covered = set()
+    starts = [first for first, last in remaining]
+    for z in current_list:
+        record_num = current_zip_record_num(z, cdf)
+        if record_num is None:
+            continue
+        i = bisect.bisect_right(starts, record_num) - 1
+        if i >= 0 and record_num <= remaining[i][1]:
+            current_zips.add(z)
+            covered.add(record_num)
+
+    # whatever is left between the 5 minute zips can't be filled
+    covered = sorted(covered)
+    unfilled = []
+    for first, last in remaining:
+        pos = first
+        i = bisect.bisect_left(covered, first)
+        while i < len(covered) and covered[i] <= last:
+            if covered[i] > pos:
+                unfilled.append((pos, covered[i] - 1))
+            pos = covered[i] + 1
+            i += 1
+        if pos <= last:
+            unfilled.append((pos, last))
+
+    return (sorted(archive_zips), sorted(current_zips), unfilled)
+
+def fetch_and_import(cdf, index_url, zips, dir):
+    """Downloads (if not already present) and imports a list of zip files."""
+    if not os.path.isdir(dir):
+        os.makedirs(dir)
+    existing = dict((z.upper(), z) for z in os.listdir(dir))
+    for z in zips:
+        if z.upper() in existing:
+            path = os.path.join(dir, existing[z.upper()])
+        else:
+            path = os.path.join(dir, z)
+            fetch_aemo_zip(index_url, z, path)
+        rows = load_dispatch_zip(path, cdf)
+        cdf.mark_zipfile_loaded(z)
+        if rows > 0:
+            cdf.sync()
+            print "%s, %d rows" % (z, rows)
+
+def format_range(cdf, first, last):
+    return "%s - %s (%d records)" % (cdf.time_for_record_num(first),
+                                      cdf.time_for_record_num(last),
+                                      last - first + 1)
+
+def parse_date(s):
+    return datetime.datetime.strptime(s, '%Y-%m-%d')
+
+if __name__ == '__main__':
+    # set up argument parser
+    parser = argparse.ArgumentParser(description='Fill gaps in AEMO dispatch CDF data.')
+    parser.add_argument('path_base', metavar='PATH',
+            help='base directory to store downloaded data in')
+    parser.add_argument('-c', '--cdf', metavar='FILE', nargs=1,
+            help='path to NetCDF file to update [default: PATH/cdf/dispatch.cdf]')
+    parser.add_argument('-g', '--generators', metavar='FILE', nargs=1,
+            help='path to generators CSV file [default: PATH/AEMO_GENERATORS.csv]')
+    parser.add_argument('-v', '--view-cache', metavar='FILE', nargs=1,
+            help='path to precomputed web app views [default: PATH/cdf/views.csv.gz]')
+    parser.add_argument('--from', dest='date_from', metavar='YYYY-MM-DD', type=parse_date,
+            help='only look for gaps on or after this date')
+    parser.add_argument('--to', dest='date_to', metavar='YYYY-MM-DD', type=parse_date,
+            help='only look for gaps before this date')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+            help='list gaps and the zips needed to fill them, but fetch nothing')
+
+    # parse command line arguments and fill in default parameters
+    args = parser.parse_args()
+    if args.cdf is None:
+        args.cdf = os.path.join(args.path_base, 'cdf', 'dispatch.cdf')
+    else:
+        args.cdf = args.cdf[0]
+    if args.generators is None:
+        args.generators = os.path.join(args.path_base, 'AEMO_GENERATORS.csv')
+    else:
+        args.generators = args.generators[0]
+    if args.view_cache is None:
+        args.view_cache = os.path.join(args.path_base, 'cdf', 'views.csv.gz')
+    else:
+        args.view_cache = args.view_cache[0]
+
+    if not os.path.exists(args.cdf):
+        sys.stderr.write('ERROR: CDF file %s does not exist\n' % args.cdf)
+        sys.exit(1)
+    # plan against the published file, and only make a working copy once
+    # there is something to fetch
+    lock = lock_cdf(args.cdf)
+    cdf = AemoCDF(args.cdf, readonly=True)
+
+    first = 0
+    last = cdf.num_rows()
+    if args.date_from is not None:
+        first = max(first, cdf.record_num_for(args.date_from) or 0)
+    if args.date_to is not None:
+        last = min(last, cdf.record_num_for(args.date_to) or 0)
+
+    gaps = cdf.missing_ranges(first, last)
+    print "Found %d gaps (%d records)" % (len(gaps), sum(b - a + 1 for a, b in gaps))
+    if len(gaps) == 0:
+        cdf.close()
+        sys.exit(0)
+    for a, b in gaps:
+        print "  " + format_range(cdf, a, b)
+
+    archive_zips, current_zips, unfilled = plan_backfill(cdf, gaps,
+        fetch_aemo_zip_list(URL_DISPATCH_ARCHIVE),
+        fetch_aemo_zip_list(URL_DISPATCH_CURRENT))
+    print "Need %d archive zips and %d 5 minute zips" % (len(archive_zips), len(current_zips))
+    for z in archive_zips + current_zips:
+        print "  " + z
+    if len(unfilled) > 0:
+        print "No AEMO zips available for %d gaps:" % len(unfilled)
+        for a, b in unfilled:
+            print "  " + format_range(cdf, a, b)
+    cdf.close()
+    if args.dry_run or len(archive_zips) + len(current_zips) == 0:
+        sys.exit(0)
+
+    work_cdf = begin_update(args.cdf)
+    cdf = AemoCDF(work_cdf)
+    fetch_and_import(cdf, URL_DISPATCH_ARCHIVE, archive_zips,
+                     os.path.join(args.path_base, 'dispatch_daily'))
+    fetch_and_import(cdf, URL_DISPATCH_CURRENT, current_zips,
+                     os.path.join(args.path_base, 'dispatch_5min'))
+
+    # make the new version visible to readers, unless nothing was filled
+    data_changed = len(cdf.dates_changed) > 0
+    cdf.update_summaries()
+    cdf.close()
+    if data_changed or cdf.zips_changed:
+        publish_update(work_cdf, args.cdf)
+        refresh_view_cache(args.cdf, args.generators, args.view_cache)
+    else:
+        discard_update(work_cdf)
+    lock.close()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python2
+#
+# benchmark_codecs.py: compare file size, ingest speed and read speed of the
+# CDF storage codec profiles.
+#
+# Copyright (c) 2014 Cameron Patrick <cameron@largestprime.net>
+#
+# This file is part of AusEnergyViz. AusEnergyViz is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, see <http://www.gnu.org/licenses/>.
+
+import netCDF4
+import numpy
+import datetime
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+
+from import_aemo import AemoCDF, CODEC_PROFILES
+
+def synthetic_dispatch(ngens, days, seed=0):
+    """Returns a (days*288, ngens) array shaped like real SCADA data: a mix
+    of baseload, daily-cycling and intermittent generators, with a share of
+    columns that are zero for part or all of the period (not yet commissioned
+    or retired), and values rounded to 3 decimal places like AEMO's."""
+    rng = numpy.random.RandomState(seed)
+    nrows = days*288
+    t = numpy.arange(nrows) / 288.0
+    data = numpy.zeros((nrows, ngens), 'f')
+    for i in xrange(ngens):
+        capacity = rng.uniform(5, 700)
+        kind = rng.randint(4)
+        if kind == 0:
+            # baseload, slowly wandering around a high output
+            col = capacity * (0.8 + 0.1*numpy.sin(2*numpy.pi*t/7 + rng.uniform(0, 7)))
+        elif kind == 1:
+            # peaking with a daily cycle, off overnight
+            col = capacity * numpy.maximum(numpy.sin(2*numpy.pi*(t - 0.3)), 0)
+        elif kind == 2:
+            # intermittent (wind-like): clipped random walk
+            col = numpy.clip(numpy.cumsum(rng.normal(0, 0.01*capacity, nrows)) + capacity/2,
+                             0, capacity)
+        else:
+            # dead column
+            col = numpy.zeros(nrows)
+        col = col + rng.normal(0, 0.002*capacity, nrows)
+        # part-period columns: commissioned late or retired early
+        if rng.uniform() < 0.2:
+            cut = rng.randint(nrows)
+            if rng.uniform() < 0.5:
+                col[:cut] = 0
+            else:
+                col[cut:] = 0
+        col[col <= 0] = 0
+        data[:,i] = numpy.round(col, 3)
+    return data
+
+def benchmark_profile(profile, gen_ids, data, start_date, dir):
+    """Ingests data into a new CDF file using the given profile and times
+    writing it and reading it back. Returns (bytes, ingest secs, full read
+    secs, single generator read secs, max abs error)."""
+    path = os.path.join(dir, '%s.cdf' % profile)
+    t0 = time.time()
+    cdf = AemoCDF(path, profile)
+    cdf.add_generators(gen_ids)
+    for r in xrange(data.shape[0]):
+        row = data[r]
+        nz = numpy.nonzero(row)[0]
+        cdf.add_dispatch_row(start_date + datetime.timedelta(minutes=5*r),
+                             dict((gen_ids[i], row[i]) for i in nz))
+    cdf.update_summaries()
+    cdf.close()
+    ingest = time.time() - t0
+
+    t0 = time.time()
+    root = netCDF4.Dataset(path, 'r')
+    readback = root.variables['dispatch_5min'][:]
+    root.close()
+    read_all = time.time() - t0
+
+    t0 = time.time()
+    root = netCDF4.Dataset(path, 'r')
+    root.variables['dispatch_5min'][:, len(gen_ids)//2]
+    root.close()
+    read_one = time.time() - t0
+
+    error = float(numpy.max(numpy.abs(numpy.ma.filled(readback, 0) - data)))
+    return (os.path.getsize(path), ingest, read_all, read_one, error)
+
+if __name__ == '__main__':
+    # set up argument parser
+    parser = argparse.ArgumentParser(description='Benchmark CDF storage codec profiles.')
+    parser.add_argument('-c', '--cdf', metavar='FILE',
+            help='take sample data from the end of an existing dispatch CDF '
+                 'instead of generating synthetic data')
+    parser.add_argument('-d', '--days', type=int, default=14,
+            help='number of days of 5 minute data to test with [default: 14]')
+    parser.add_argument('-g', '--gens', type=int, default=400,
+            help='number of generators for synthetic data [default: 400]')
+    parser.add_argument('-p', '--profiles', metavar='PROFILE', nargs='+',
+            choices=sorted(CODEC_PROFILES), default=sorted(CODEC_PROFILES),
+            help='profiles to test [default: all]')
+    args = parser.parse_args()
+
+    start_date = datetime.datetime(2014, 1, 1, 0, 0, 0)
+    if args.cdf is not None:
+        src = netCDF4.Dataset(args.cdf, 'r')
+        var = src.variables['dispatch_5min']
+        first = max(var.shape[0] - args.days*288, 0)
+        data = numpy.ma.filled(var[first:,:], 0).astype('f')
+        gen_ids = list(netCDF4.chartostring(src.variables['gen_ids'][:]))
+        src.close()
+    else:
+        data = synthetic_dispatch(args.gens, args.days)
+        gen_ids = ['GEN%.4d' % i for i in xrange(data.shape[1])]
+    sys.stderr.write('Testing with %d records x %d generators\n' % data.shape)
+
+    dir = tempfile.mkdtemp()
+    try:
+        print "%-10s %12s %10s %10s %10s %10s" % (
+            'profile', 'bytes', 'ingest s', 'read s', 'column s', 'max err')
+        for profile in args.profiles:
+            size, ingest, read_all, read_one, error = \
+                benchmark_profile(profile, gen_ids, data, start_date, dir)
+            print "%-10s %12d %10.2f %10.3f %10.3f %10.4f" % (
+                profile, size, ingest, read_all, read_one, error)
+    finally:
+        shutil.rmtree(dir)
@@ -67,6 +67,12 @@ def extract_regexp_set(page, regexp):
     """
     return sorted(set(re.findall(regexp, page)))
 
+def archive_zip_name(date_str):
+    """Returns the name of the daily archive zip for a date string of the
+    form YYYYMMDD (any trailing time or sequence digits are ignored).
+    """
+    return 'PUBLIC_DISPATCHSCADA_%s.ZIP' % date_str[0:8]
+
 def archived_zip_exists(z, archive_list):
     """Given a 'long' dispatch zip name (for a 5 minute data point), see
     if there is a matching daily archive zip present in the given set.
@@ -75,8 +81,30 @@ def archived_zip_exists(z, archive_list):
     if date_match is None:
         return False
     date_str = date_match.group(1)
-    archive_file = 'PUBLIC_DISPATCHSCADA_%s.ZIP' % date_str[0:8]
-    return archive_file in archive_list
+    return archive_zip_name(date_str) in archive_list
+
+def fetch_aemo_zip_list(index_url):
+    """Returns a sorted list of the dispatch zip files listed on an AEMO
+    index page.
+    """
+    sys.stderr.write("%s: " % index_url)
+    index_html = fetch_url(index_url)
+
+    zip_list = extract_regexp_set(index_html, r'(?i)PUBLIC_DISPATCHSCADA_[0-9_]+.zip')
+    sys.stderr.write("found %d zips.\n" % len(zip_list))
+    return zip_list
+
+def fetch_aemo_zip(index_url, z, path):
+    """Downloads a single zip file from an AEMO index page and saves it."""
+    sys.stderr.write("Downloading: %s " % z)
+    zip_content = fetch_url(index_url + z)
+
+    # save to file
+    f = file(path, 'wb')
+    f.write(zip_content)
+    f.close()
+
+    sys.stderr.write("[%d bytes]\n" % len(zip_content))
 
 def fetch_aemo_zips(index_url, dir, dir_archive=None):
     """Downloads AEMO dispatch zip files from the AEMO web site. Zip files which
@@ -91,11 +119,7 @@ def fetch_aemo_zips(index_url, dir, dir_archive=None):
         dir_archive: if present, the path to archived dispatch data so we know
             what 5min data can be skipped or deleted
     """
-    sys.stderr.write("%s: " % index_url)
-    index_html = fetch_url(index_url)
-
-    zip_list = extract_regexp_set(index_html, r'(?i)PUBLIC_DISPATCHSCADA_[0-9_]+.zip')
-    sys.stderr.write("found %d zips.\n" % len(zip_list))
+    zip_list = fetch_aemo_zip_list(index_url)
 
     if not os.path.isdir(dir):
         os.makedirs(dir)
@@ -123,15 +147,7 @@ def fetch_aemo_zips(index_url, dir, dir_archive=None):
             continue
 
         # download from web site
-        sys.stderr.write("Downloading: %s " % z)
-        zip_content = fetch_url(index_url + z)
-
-        # save to file
-        f = file(path, 'wb')
-        f.write(zip_content)
-        f.close()
-        
-        sys.stderr.write("[%d bytes]\n" % len(zip_content))
+        fetch_aemo_zip(index_url, z, path)
     sys.stderr.write("Skipped %d zips.\n" % skipped)
 
     # clean old zip files
@@ -0,0 +1,238 @@
+#!/usr/bin/env python2
+#
+# export_aemo.py: export dispatch data from the CDF file to CSV or a
+# compressed columnar NetCDF file.
+#
+# Copyright (c) 2014 Cameron Patrick <cameron@largestprime.net>
+#
+# This file is part of AusEnergyViz. AusEnergyViz is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, see <http://www.gnu.org/licenses/>.
+
+import netCDF4
+import numpy
+import datetime
+import os
+import sys
+import argparse
+
+from nemdata import TIMESCALE_MINUTES, read_generator_groups
+
+# The export is a pipeline of generators, each yielding (record numbers, data)
+# blocks of at most BLOCK_CHUNKS time chunks, so memory use depends only on
+# the block size and number of generators, not on the length of the range.
+TIME_CHUNK = 16
+BLOCK_CHUNKS = 288
+
+def block_ranges(first, last, block):
+    """Yields (start, end) record ranges covering first to last inclusive,
+    split on multiples of block so reads line up with the file's chunks."""
+    start = first
+    while start <= last:
+        end = min((start // block + 1) * block, last + 1)
+        yield (start, end)
+        start = end
+
+def read_blocks(root, timescale, first, last, columns):
+    """Yields blocks of dispatch data for records first to last and the given
+    generator columns. Generators the activity index shows as having no output
+    during a block are filled with zeros rather than read. For 5 minute data,
+    records with no data are left out."""
+    var = root.variables['dispatch_' + timescale]
+    seen = root.variables['seen'] if timescale == '5min' else None
+    columns = numpy.asarray(columns, 'i8')
+    if 'gen_first_active' in root.variables:
+        first_active = numpy.ma.filled(root.variables['gen_first_active'][:], -1)[columns]
+        last_active = numpy.ma.filled(root.variables['gen_last_active'][:], -1)[columns]
+    else:
+        first_active = numpy.zeros(len(columns), 'i8')
+        last_active = numpy.zeros(len(columns), 'i8') + var.shape[0]*288
+    per_record = TIMESCALE_MINUTES[timescale] // 5
+    for start, end in block_ranges(first, last, TIME_CHUNK*BLOCK_CHUNKS):
+        active = numpy.nonzero((first_active >= 0) & (first_active < end*per_record) &
+                               (last_active >= start*per_record))[0]
+        data = numpy.zeros((end - start, len(columns)), 'f')
+        if len(active) > 0:
+            cols = columns[active]
+            lo = cols.min()
+            hi = cols.max() + 1
+            data[:, active] = numpy.ma.filled(var[start:end, lo:hi], 0)[:, cols - lo]
+        records = numpy.arange(start, end)
+        if seen is not None:
+            keep = numpy.ma.filled(seen[start:end], 0) != 0
+            data = data[keep]
+            records = records[keep]
+        if len(records) > 0:
+            yield (records, data)
+
+def aggregate_columns(blocks, matrix):
+    """Sums generator columns into groups using a (gens x groups) matrix."""
+    for records, data in blocks:
+        yield (records, numpy.dot(data, matrix))
+
+def time_strings(start_date, step, records):
+    return [(start_date + int(r)*step).strftime('%Y-%m-%d %H:%M') for r in records]
+
+def write_wide_csv(f, names, start_date, step, blocks, fmt):
+    """Writes one row per time and one column per series. Each row is
+    formatted with a single % operation and each block written at once."""
+    f.write('time,%s\n' % ','.join(names))
+    row_fmt = '%s' + (',' + fmt)*len(names) + '\n'
+    for records, data in blocks:
+        times = time_strings(start_date, step, records)
+        f.write(''.join([row_fmt % ((t,) + tuple(row))
+                         for t, row in zip(times, data.tolist())]))
+
+def write_long_csv(f, names, start_date, step, blocks, fmt, nonzero=False):
+    """Writes one row per time and series, optionally leaving out zeros.
+    Each block is formatted with numpy's string array operations and
+    written at once."""
+    f.write('time,id,output\n')
+    names = numpy.array(names, 'S')
+    for records, data in blocks:
+        if nonzero:
+            rows, cols = numpy.nonzero(data)
+        else:
+            rows, cols = [a.ravel() for a in numpy.indices(data.shape)]
+        if len(rows) == 0:
+            continue
+        times = numpy.array(time_strings(start_date, step, records), 'S')
+        lines = numpy.char.add(numpy.char.add(times[rows], ','), names[cols])
+        lines = numpy.char.add(numpy.char.add(lines, ','), numpy.char.mod(fmt, data[rows, cols]))
+        f.write('\n'.join(lines.tolist()) + '\n')
+
+def write_columnar(path, names, start_date, step, blocks):
+    """Writes a NetCDF file with one compressed column per series. Each
+    block of each series is stored as its own chunk, so reading one series
+    doesn't touch the others."""
+    out = netCDF4.Dataset(path, 'w')
+    out.createDimension('time')
+    out.createDimension('series', len(names))
+    out.createDimension('string_len', max([len(n) for n in names] + [1]))
+    time_var = out.createVariable('time', 'i4', ('time',), zlib=True)
+    time_var.units = 'minutes since %s' % start_date.strftime('%Y-%m-%d %H:%M:%S')
+    ids = out.createVariable('series_ids', 'S1', ('series', 'string_len'))
+    for i, name in enumerate(names):
+        ids[i,:] = netCDF4.stringtoarr(name, len(out.dimensions['string_len']))
+    output = out.createVariable('output', 'f4', ('time', 'series'),
+                                zlib=True, shuffle=True,
+                                chunksizes=(TIME_CHUNK*BLOCK_CHUNKS, 1))
+    output.units = 'MW'
+    minutes = int(step.total_seconds() // 60)
+    n = 0
+    for records, data in blocks:
+        time_var[n:n+len(records)] = records*minutes
+        output[n:n+len(records), :] = data
+        n += len(records)
+    out.close()
+
+def parse_date(s):
+    return datetime.datetime.strptime(s, '%Y-%m-%d')
+
+if __name__ == '__main__':
+    # set up argument parser
+    parser = argparse.ArgumentParser(description='Export AEMO dispatch data from CDF.')
+    parser.add_argument('path_base', metavar='PATH',
+            help='base directory containing downloaded data')
+    parser.add_argument('output', metavar='OUTPUT',
+            help='file to write, or - for standard output (CSV formats only)')
+    parser.add_argument('-c', '--cdf', metavar='FILE',
+            help='path to NetCDF file to read [default: PATH/cdf/dispatch.cdf]')
+    parser.add_argument('-g', '--generators', metavar='FILE',
+            help='path to generators CSV file [default: PATH/AEMO_GENERATORS.csv]')
+    parser.add_argument('-f', '--format', choices=['long', 'wide', 'cdf'], default='wide',
+            help='long or wide CSV, or columnar NetCDF [default: wide]')
+    parser.add_argument('-t', '--timescale', choices=sorted(TIMESCALE_MINUTES), default='5min',
+            help='time resolution to export [default: 5min]')
+    parser.add_argument('--from', dest='date_from', metavar='YYYY-MM-DD', type=parse_date,
+            help='first date to export [default: start of data]')
+    parser.add_argument('--to', dest='date_to', metavar='YYYY-MM-DD', type=parse_date,
+            help='last date to export [default: end of data]')
+    parser.add_argument('--region', metavar='REGION', nargs='+',
+            help='only export generators in these regions (e.g. VIC NSW)')
+    parser.add_argument('--fuel', metavar='FUEL', nargs='+',
+            help='only export generators with these fuel types (e.g. Coal Wind)')
+    parser.add_argument('--by', choices=['region', 'fuel', 'region,fuel'],
+            help='export totals by region and/or fuel instead of each generator')
+    parser.add_argument('--nonzero', action='store_true',
+            help='leave out zero values (long format only)')
+
+    # parse command line arguments and fill in default parameters
+    args = parser.parse_args()
+    if args.cdf is None:
+        args.cdf = os.path.join(args.path_base, 'cdf', 'dispatch.cdf')
+    if args.generators is None:
+        args.generators = os.path.join(args.path_base, 'AEMO_GENERATORS.csv')
+    if args.format == 'cdf' and args.output == '-':
+        parser.error('columnar output must be written to a file')
+
+    # open read-only, so we keep reading this version of the file even if
+    # an import publishes a new one while we're running
+    root = netCDF4.Dataset(args.cdf, 'r')
+    start_date = root.variables['start_date'][:]
+    start_date = datetime.datetime(start_date[0], start_date[1], start_date[2], 0, 0, 0)
+    gen_ids = list(netCDF4.chartostring(root.variables['gen_ids'][:]))
+    step = datetime.timedelta(minutes=TIMESCALE_MINUTES[args.timescale])
+    nrows = root.variables['dispatch_' + args.timescale].shape[0]
+
+    # work out the range of records to export
+    def record_num(dt):
+        delta = dt - start_date
+        return (delta.days*24*60 + delta.seconds//60) // TIMESCALE_MINUTES[args.timescale]
+    first = 0
+    last = nrows - 1
+    if args.date_from is not None:
+        first = max(first, record_num(args.date_from))
+    if args.date_to is not None:
+        last = min(last, record_num(args.date_to + datetime.timedelta(days=1)) - 1)
+
+    # choose generators, and groups to sum them into
+    groups = None
+    if args.region or args.fuel or args.by:
+        groups = read_generator_groups(args.generators)
+    columns = []
+    for i, gen_id in enumerate(gen_ids):
+        if groups is not None:
+            if gen_id not in groups: continue
+            region, fuel = groups[gen_id]
+            if args.region and region not in args.region: continue
+            if args.fuel and fuel not in args.fuel: continue
+        columns.append(i)
+
+    blocks = read_blocks(root, args.timescale, first, last, columns)
+    if args.by is None:
+        names = [gen_ids[i] for i in columns]
+    else:
+        fields = args.by.split(',')
+        keys = [tuple(groups[gen_ids[i]][0 if f == 'region' else 1] for f in fields)
+                for i in columns]
+        names_keys = sorted(set(keys))
+        key_index = dict((k, j) for j, k in enumerate(names_keys))
+        matrix = numpy.zeros((len(columns), len(names_keys)), 'f8')
+        for n, k in enumerate(keys):
+            matrix[n, key_index[k]] = 1
+        names = ['.'.join(k) for k in names_keys]
+        blocks = aggregate_columns(blocks, matrix)
+
+    sys.stderr.write('Exporting %d series, records %d to %d\n' % (len(names), first, last))
+    fmt = '%.3f'
+    if args.format == 'cdf':
+        write_columnar(args.output, names, start_date, step, blocks)
+    else:
+        f = sys.stdout if args.output == '-' else open(args.output, 'wb')
+        if args.format == 'wide':
+            write_wide_csv(f, names, start_date, step, blocks, fmt)
+        else:
+            write_long_csv(f, names, start_date, step, blocks, fmt, args.nonzero)
+        if f is not sys.stdout:
+            f.close()
+    root.close()
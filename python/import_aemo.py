@@ -26,6 +26,11 @@ import os
 import re
 import sys
 import argparse
+import fcntl
+import shutil
+
+import nemdata
+import view_cache
 
 def read_generators_csv(path):
     gen_list = []
@@ -61,15 +66,61 @@ def read_generators_csv(path):
     # return list of IDs only
     return [row[0] for row in gen_list]
 
+# Storage settings for the dispatch variables of new (or migrated) CDF files.
+# Each profile gives the on-disk type, the zlib compression level (0 for
+# none), whether to apply the HDF5 shuffle filter, and optionally lossy
+# quantisation (least_significant_digit) or fixed-point packing (scale_factor
+# and add_offset, applied transparently by netCDF4 and by R's ncdf4).
+# SCADA values are only meaningful to a few decimal places, so the lossy
+# profiles give up little real precision.
+CODEC_PROFILES = {
+    # the original settings: float32, default zlib level and netCDF4's
+    # default of shuffle on
+    'default': dict(dtype='f4', complevel=4, shuffle=True),
+    'none': dict(dtype='f4', complevel=0, shuffle=False),
+    'noshuffle': dict(dtype='f4', complevel=4, shuffle=False),
+    'fast': dict(dtype='f4', complevel=1, shuffle=True),
+    'small': dict(dtype='f4', complevel=9, shuffle=True),
+    # keep 0.1 MW of precision
+    'lossy': dict(dtype='f4', complevel=4, shuffle=True,
+                  least_significant_digit=1),
+    # 16 bit integers in units of 0.1 MW, range +/-3276.7 MW; values outside
+    # that are clipped by clip_to_storage
+    'fixed': dict(dtype='i2', complevel=4, shuffle=True,
+                  scale_factor=0.1, add_offset=0.0),
+}
+DEFAULT_PROFILE = 'default'
+
+def clip_to_storage(var, values):
+    """Clips values to the range a fixed-point (scaled integer) variable can
+    hold, with a warning, so they don't wrap around when packed. Values for
+    other variables are returned unchanged."""
+    if var.dtype.kind not in 'iu' or 'scale_factor' not in var.ncattrs():
+        return values
+    info = numpy.iinfo(var.dtype)
+    scale = var.scale_factor
+    offset = getattr(var, 'add_offset', 0.0)
+    # keep clear of the two most negative integers, used as fill values
+    lo = (info.min + 2)*scale + offset
+    hi = info.max*scale + offset
+    if numpy.any(values < lo) or numpy.any(values > hi):
+        sys.stderr.write('WARNING: clipping values outside %g to %g for %s\n'
+                         % (lo, hi, var.name))
+        values = numpy.clip(values, lo, hi)
+    return values
+
 class AemoCDF(object):
     STRING_LEN = 64
 
-    def __init__(self, filename):
+    def __init__(self, filename, profile=DEFAULT_PROFILE, readonly=False):
         dirname = os.path.dirname(filename)
         if len(dirname) > 0 and not os.path.exists(dirname):
             os.makedirs(dirname)
 
-        if os.path.exists(filename):
+        if readonly:
+            self.root = netCDF4.Dataset(filename, 'r')
+            new_file = False
+        elif os.path.exists(filename):
             self.root = netCDF4.Dataset(filename, 'a')
             new_file = False
         else:
@@ -92,19 +143,21 @@ class AemoCDF(object):
         if new_file:
             self.root.createVariable('start_date', 'i4', ('date_field',))
             self.root.variables['start_date'][:] = [0,0,0]
-            self.root.createVariable('dispatch_5min', 'f4', ('time_5min', 'gens'), 
-                                     zlib=True, chunksizes=(16, 288))
-            self.root.createVariable('dispatch_30min', 'f4', ('time_30min', 'gens'), 
-                                     zlib=True, chunksizes=(16, 336))
-            self.root.createVariable('dispatch_daily', 'f4', ('time_daily', 'gens'), 
-                                     zlib=True, chunksizes=(16, 365))
-            self.root.createVariable('dispatch_daily_min', 'f4', ('time_daily', 'gens'), 
-                                     zlib=True, chunksizes=(16, 365))
-            self.root.createVariable('dispatch_daily_max', 'f4', ('time_daily', 'gens'), 
-                                     zlib=True, chunksizes=(16, 365))
+            self.create_dispatch_variable('dispatch_5min', 'time_5min', 288, profile)
+            self.create_dispatch_variable('dispatch_30min', 'time_30min', 336, profile)
+            self.create_dispatch_variable('dispatch_daily', 'time_daily', 365, profile)
+            self.create_dispatch_variable('dispatch_daily_min', 'time_daily', 365, profile)
+            self.create_dispatch_variable('dispatch_daily_max', 'time_daily', 365, profile)
             self.root.createVariable('seen', 'i1', ('time_5min',), 
                                      zlib=True, chunksizes=(288,), fill_value=0)
             self.root.createVariable('gen_ids', 'S1', ('gens', 'string_len'))
+            self.root.codec_profile = profile
+        build_activity_index = False
+        if 'gen_first_active' not in self.root.variables and not readonly:
+            self.create_activity_index()
+            build_activity_index = not new_file
+        if 'partial_zips' not in self.root.variables and not readonly:
+            self.create_partial_zips()
         self.var_dispatch_5min = self.root.variables['dispatch_5min']
         self.var_dispatch_30min = self.root.variables['dispatch_30min']
         self.var_dispatch_daily = self.root.variables['dispatch_daily']
@@ -112,22 +165,52 @@ class AemoCDF(object):
         self.var_dispatch_daily_max = self.root.variables['dispatch_daily_max']
         self.var_seen = self.root.variables['seen']
         self.var_gen_ids = self.root.variables['gen_ids']
+        # (a read-only file from before the activity index has none)
+        self.var_gen_first_active = self.root.variables.get('gen_first_active')
+        self.var_gen_last_active = self.root.variables.get('gen_last_active')
+        self.var_active_monthly = self.root.variables.get('active_monthly')
+        self.var_partial_zips = self.root.variables.get('partial_zips')
 
-        start_date = self.root.variables['start_date'][:]
-        if start_date[0] > 0:
-            self.start_date = datetime.datetime(start_date[0], start_date[1], start_date[2], 0, 0, 0)
-        else:
-            self.start_date = None
-        
+        self.load_start_date()
         self.update_gen_id_dict()
+        self.load_activity_index()
+        self.load_partial_zips()
+        if build_activity_index:
+            self.rebuild_activity_index()
         
         self.dates_changed = set()
 
-        self.sync()
+        if not readonly:
+            self.sync()
+
+    def create_dispatch_variable(self, name, time_dim, chunk_gens, profile):
+        settings = CODEC_PROFILES[profile]
+        var = self.root.createVariable(name, settings['dtype'], (time_dim, 'gens'),
+                                       zlib=settings['complevel'] > 0,
+                                       complevel=max(settings['complevel'], 1),
+                                       shuffle=settings['shuffle'],
+                                       least_significant_digit=settings.get('least_significant_digit'),
+                                       chunksizes=(16, chunk_gens))
+        if 'scale_factor' in settings:
+            var.scale_factor = settings['scale_factor']
+            var.add_offset = settings['add_offset']
+        return var
 
     def sync(self):
+        self.flush_activity_index()
         self.root.sync()
+
+    def close(self):
+        self.flush_activity_index()
+        self.root.close()
     
+    def load_start_date(self):
+        start_date = self.root.variables['start_date'][:]
+        if start_date[0] > 0:
+            self.start_date = datetime.datetime(start_date[0], start_date[1], start_date[2], 0, 0, 0)
+        else:
+            self.start_date = None
+
     def num_rows(self):
         return len(self.dim_time_5min)
 
@@ -146,6 +229,9 @@ class AemoCDF(object):
                     self.var_dispatch_daily, self.var_dispatch_daily_min, self.var_dispatch_daily_max]:
             npoints = var.shape[0]
             var[:,i] = numpy.zeros((npoints, 1))
+        self.gen_first_active = numpy.append(self.gen_first_active, -1)
+        self.gen_last_active = numpy.append(self.gen_last_active, -1)
+        self.activity_changed = True
     
     def add_generators(self, generators):
         for new_gen in generators:
@@ -165,6 +251,25 @@ class AemoCDF(object):
         record_num = delta.days*24*12 + delta.seconds//300
         return record_num
 
+    def time_for_record_num(self, record_num):
+        return self.start_date + datetime.timedelta(minutes=5*record_num)
+
+    def missing_ranges(self, first=0, last=None):
+        """Returns a list of (first, last) record number pairs, inclusive,
+        for each run of 5 minute intervals with no data between records
+        first and last (exclusive)."""
+        if last is None:
+            last = len(self.dim_time_5min)
+        if self.start_date is None or last <= first:
+            return []
+        # unwritten entries of seen come back masked, so treat them as unseen
+        seen = numpy.ma.filled(self.var_seen[first:last], 0) != 0
+        # pad with 'seen' at both ends so every gap has a falling and rising edge
+        edges = numpy.diff(numpy.concatenate(([1], seen.astype('i1'), [1])))
+        starts = numpy.nonzero(edges == -1)[0]
+        ends = numpy.nonzero(edges == 1)[0] - 1
+        return [(first + int(s), first + int(e)) for s, e in zip(starts, ends)]
+
     def have_row_data(self, dt):
         record_num = self.record_num_for(dt)
         if record_num is None or record_num >= len(self.dim_time_5min):
@@ -192,6 +297,31 @@ class AemoCDF(object):
             return self.have_row_data(dt)
         return False
 
+    def create_partial_zips(self):
+        self.root.createDimension('zips')
+        self.root.createVariable('partial_zips', 'S1', ('zips', 'string_len'))
+
+    def load_partial_zips(self):
+        """Reads the names of zip files that have been imported but don't
+        cover all of the records have_zipfile_data looks for (e.g. a daily
+        archive with a missing interval), so they aren't retried forever."""
+        self.partial_zips = set()
+        self.zips_changed = False
+        if self.var_partial_zips is not None and len(self.var_partial_zips) > 0:
+            self.partial_zips.update(netCDF4.chartostring(self.var_partial_zips[:]))
+
+    def zipfile_loaded(self, filename):
+        return filename.upper() in self.partial_zips or self.have_zipfile_data(filename)
+
+    def mark_zipfile_loaded(self, filename):
+        if self.zipfile_loaded(filename):
+            return
+        name = filename.upper()
+        self.var_partial_zips[len(self.partial_zips),:] = \
+            netCDF4.stringtoarr(name, len(self.dim_str))
+        self.partial_zips.add(name)
+        self.zips_changed = True
+
     def add_dispatch_row(self, dt, data):
         record_num = self.record_num_for(dt, True)
         if record_num is None:
@@ -208,8 +338,9 @@ class AemoCDF(object):
         row = numpy.zeros((1,len(self.dim_gens)), 'f')
         for station_id, megawatts in data.iteritems():
             row[0,self.gen_id_dict[station_id]] = megawatts
-        self.var_dispatch_5min[record_num,:] = row
+        self.var_dispatch_5min[record_num,:] = clip_to_storage(self.var_dispatch_5min, row)
         self.var_seen[record_num] = 1
+        self.mark_active(record_num, numpy.nonzero(row[0])[0])
 
     def update_summary_day(self, year, month, day):
         dt_start = datetime.datetime(year, month, day, 0, 0, 0)
@@ -217,22 +348,25 @@ class AemoCDF(object):
         record_num_30min = record_num // 6
         record_num_daily = record_num // 288
 
-        # fetch dispatch data for that day
-        day_data = self.var_dispatch_5min[record_num:record_num+288,:]
         seen_data = self.var_seen[record_num:record_num+288]
         nseen_day = sum(seen_data)
         if nseen_day < 1:
             return
         print "Processing summary data for %.4d-%.2d-%.2d" % (year,month,day)
 
+        # fetch dispatch data for that day, only for generators with any
+        # output; summaries for the rest are zero
+        active = self.active_generators(record_num, record_num + 287)
+        day_data = self.read_active_columns(self.var_dispatch_5min,
+                                            record_num, record_num + 288, active)
+
         # average daily load
-        shape = (1, len(self.dim_gens))
         self.var_dispatch_daily[record_num_daily,:] = \
-            numpy.reshape(sum(day_data) / sum(seen_data), shape)
+            self.expand_active_row(sum(day_data) / sum(seen_data), active)
         self.var_dispatch_daily_min[record_num_daily,:] = \
-            numpy.reshape(numpy.amin(day_data, 0), shape)
+            self.expand_active_row(numpy.amin(day_data, 0), active)
         self.var_dispatch_daily_max[record_num_daily,:] = \
-            numpy.reshape(numpy.amax(day_data, 0), shape)
+            self.expand_active_row(numpy.amax(day_data, 0), active)
 
         # average 30 minute periods
         for i in xrange(48):
@@ -241,7 +375,137 @@ class AemoCDF(object):
             nseen = sum(seen_data[start:end])
             if nseen < 1: continue
             self.var_dispatch_30min[record_num_30min + i,:] = \
-                numpy.reshape(sum(day_data[start:end,:]) / nseen, shape)
+                self.expand_active_row(sum(day_data[start:end,:]) / nseen, active)
+
+    def create_activity_index(self):
+        self.root.createDimension('time_monthly')
+        self.root.createVariable('gen_first_active', 'i4', ('gens',), fill_value=-1)
+        self.root.createVariable('gen_last_active', 'i4', ('gens',), fill_value=-1)
+        self.root.createVariable('active_monthly', 'i1', ('time_monthly', 'gens'),
+                                 zlib=True, chunksizes=(12, 365), fill_value=0)
+
+    def load_activity_index(self):
+        """Reads the first and last 5 minute record with non-zero output for
+        each generator (-1 if none). Months with activity are accumulated in
+        active_months and written out by flush_activity_index."""
+        ngens = len(self.dim_gens)
+        self.active_months = {}
+        self.activity_changed = False
+        if self.var_gen_first_active is None:
+            # no index, so treat every generator as active throughout
+            self.gen_first_active = numpy.zeros(ngens, 'i8')
+            self.gen_last_active = numpy.zeros(ngens, 'i8') + self.num_rows()
+            return
+        self.gen_first_active = numpy.zeros(ngens, 'i8') - 1
+        self.gen_last_active = numpy.zeros(ngens, 'i8') - 1
+        nstored = len(self.var_gen_first_active)
+        if nstored > 0:
+            self.gen_first_active[:nstored] = numpy.ma.filled(self.var_gen_first_active[:], -1)
+            self.gen_last_active[:nstored] = numpy.ma.filled(self.var_gen_last_active[:], -1)
+
+    def month_num_for_record(self, record_num):
+        dt = self.time_for_record_num(record_num)
+        return (dt.year - self.start_date.year)*12 + dt.month - self.start_date.month
+
+    def mark_active(self, record_num, gens):
+        if len(gens) == 0:
+            return
+        first = self.gen_first_active[gens]
+        self.gen_first_active[gens] = numpy.where((first < 0) | (first > record_num),
+                                                  record_num, first)
+        self.gen_last_active[gens] = numpy.maximum(self.gen_last_active[gens], record_num)
+        month = self.month_num_for_record(record_num)
+        bits = self.active_months.get(month)
+        if bits is None or len(bits) < len(self.dim_gens):
+            new_bits = numpy.zeros(len(self.dim_gens), bool)
+            if bits is not None:
+                new_bits[:len(bits)] = bits
+            bits = self.active_months[month] = new_bits
+        bits[gens] = True
+        self.activity_changed = True
+
+    def flush_activity_index(self):
+        if not self.activity_changed:
+            return
+        ngens = len(self.dim_gens)
+        if ngens > 0:
+            self.var_gen_first_active[0:ngens] = self.gen_first_active
+            self.var_gen_last_active[0:ngens] = self.gen_last_active
+        for month, bits in self.active_months.iteritems():
+            row = numpy.zeros(ngens, bool)
+            row[:len(bits)] = bits
+            if month < self.var_active_monthly.shape[0]:
+                row |= numpy.ma.filled(self.var_active_monthly[month,:], 0) != 0
+            self.var_active_monthly[month,:] = row.astype('i1')
+        self.active_months = {}
+        self.activity_changed = False
+
+    def rebuild_activity_index(self):
+        """Builds the activity index of an existing file from the daily
+        maximum summaries, refining first and last records from the 5 minute
+        data of the first and last active days."""
+        ndays = self.var_dispatch_daily_max.shape[0]
+        if self.start_date is None or ndays == 0 or len(self.dim_gens) == 0:
+            return
+        print "Building generator activity index"
+        active_days = numpy.ma.filled(self.var_dispatch_daily_max[:], 0) > 0
+        any_active = numpy.any(active_days, 0)
+        first_day = numpy.argmax(active_days, 0)
+        last_day = ndays - 1 - numpy.argmax(active_days[::-1], 0)
+
+        # whole days to start with, in case the 5 minute data doesn't agree
+        self.gen_first_active[:] = numpy.where(any_active, first_day*288, -1)
+        self.gen_last_active[:] = numpy.where(any_active, last_day*288 + 287, -1)
+        for day in numpy.unique(numpy.concatenate((first_day[any_active], last_day[any_active]))):
+            day_data = numpy.ma.filled(self.var_dispatch_5min[day*288:(day+1)*288,:], 0) > 0
+            if day_data.shape[0] == 0:
+                continue
+            gens = numpy.nonzero(any_active & (first_day == day) & numpy.any(day_data, 0))[0]
+            self.gen_first_active[gens] = day*288 + numpy.argmax(day_data[:,gens], 0)
+            gens = numpy.nonzero(any_active & (last_day == day) & numpy.any(day_data, 0))[0]
+            self.gen_last_active[gens] = day*288 + day_data.shape[0] - 1 - \
+                numpy.argmax(day_data[::-1,gens], 0)
+
+        # days run in order, so each month is a contiguous run of rows
+        months = numpy.array([self.month_num_for_record(day*288) for day in xrange(ndays)])
+        starts = numpy.concatenate(([0], numpy.nonzero(numpy.diff(months))[0] + 1))
+        self.var_active_monthly[0:len(starts),:] = \
+            numpy.logical_or.reduceat(active_days, starts, 0).astype('i1')
+        self.activity_changed = True
+
+    def active_generators(self, first, last):
+        """Returns the indices of generators that may have non-zero output
+        between 5 minute records first and last (inclusive)."""
+        self.flush_activity_index()
+        active = (self.gen_first_active >= 0) & (self.gen_first_active <= last) & \
+                 (self.gen_last_active >= first)
+        if self.var_active_monthly is None:
+            return numpy.nonzero(active)[0]
+        month_first = self.month_num_for_record(first)
+        month_last = min(self.month_num_for_record(last), self.var_active_monthly.shape[0] - 1)
+        if month_last >= month_first:
+            months = numpy.ma.filled(self.var_active_monthly[month_first:month_last+1,:], 0)
+            active &= numpy.any(months != 0, 0)
+        else:
+            active[:] = False
+        return numpy.nonzero(active)[0]
+
+    def read_active_columns(self, var, start, end, active):
+        """Reads rows start to end (exclusive) of a dispatch variable for the
+        given generator columns only, reading the smallest contiguous range
+        of columns that contains them."""
+        if len(active) == 0:
+            return numpy.zeros((max(min(end, var.shape[0]) - start, 0), 0), 'f')
+        lo = active[0]
+        hi = active[-1] + 1
+        return var[start:end, lo:hi][:, active - lo]
+
+    def expand_active_row(self, values, active):
+        """Returns a (1, gens) row with values at the active columns and
+        zero elsewhere, clipped to what the dispatch variables can hold."""
+        row = numpy.ma.zeros((1, len(self.dim_gens)), 'f')
+        row[0, active] = values
+        return clip_to_storage(self.var_dispatch_5min, row)
 
     def update_summaries(self):
         dates = list(self.dates_changed)
@@ -250,6 +514,66 @@ class AemoCDF(object):
             self.update_summary_day(year, month, day)
         self.dates_changed = set()
 
+# Readers (the R package and web app) open the CDF file by name for each query.
+# Rather than updating it in place, writers take a lock, work on a private
+# copy and then rename the copy over the original. A reader that already has
+# the old file open keeps reading that version until it closes it, and never
+# sees a partly imported file.
+WORK_SUFFIX = '.work'
+LOCK_SUFFIX = '.lock'
+
+def lock_cdf(filename):
+    """Waits for an exclusive lock on updating a CDF file. The lock is held
+    until the returned file object is closed (or the process exits)."""
+    dirname = os.path.dirname(filename)
+    if len(dirname) > 0 and not os.path.exists(dirname):
+        os.makedirs(dirname)
+    lock = open(filename + LOCK_SUFFIX, 'w')
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    return lock
+
+def begin_update(filename):
+    """Returns the path of a fresh working copy of a CDF file to write to.
+    The copy keeps the file's permissions and (where allowed) group, so they
+    survive publishing it. The caller must hold the lock from lock_cdf."""
+    work_filename = filename + WORK_SUFFIX
+    if os.path.exists(filename):
+        shutil.copyfile(filename, work_filename)
+        shutil.copymode(filename, work_filename)
+        try:
+            os.chown(work_filename, -1, os.stat(filename).st_gid)
+        except OSError:
+            sys.stderr.write('WARNING: could not set group of %s\n' % work_filename)
+    elif os.path.exists(work_filename):
+        # left behind by an update that didn't finish
+        os.unlink(work_filename)
+    return work_filename
+
+def publish_update(work_filename, filename):
+    """Atomically replaces a CDF file with a (closed) working copy."""
+    f = open(work_filename, 'rb')
+    os.fsync(f.fileno())
+    f.close()
+    os.rename(work_filename, filename)
+
+def discard_update(work_filename):
+    """Throws away a (closed) working copy without publishing it."""
+    os.unlink(work_filename)
+
+def refresh_view_cache(filename, generators_filename, view_cache_filename):
+    """Rebuilds the web app's precomputed views from a published CDF file if
+    the cache is missing or older than the file. The caller must hold the
+    lock from lock_cdf."""
+    if not os.path.exists(filename) or not os.path.exists(generators_filename):
+        return
+    if os.path.exists(view_cache_filename) and \
+            os.path.getmtime(view_cache_filename) >= os.path.getmtime(filename):
+        return
+    cdf = AemoCDF(filename, readonly=True)
+    view_cache.update_view_cache(cdf, nemdata.read_generator_groups(generators_filename),
+                                 view_cache_filename)
+    cdf.close()
+
 def load_dispatch_csv(file_obj, aemo_cdf):
     dt = None
     data = {}
@@ -289,17 +613,23 @@ def load_dispatch_zip(file_path, aemo_cdf):
     return rows
 
 
+def find_new_zips(zip_dir, aemo_cdf):
+    """Returns a sorted list of the zip files in a directory that haven't
+    been imported into the CDF yet."""
+    if not os.path.isdir(zip_dir):
+        return []
+    files = sorted(os.listdir(zip_dir))
+    return [f for f in files
+            if f.lower().endswith('.zip') and not aemo_cdf.zipfile_loaded(f)]
+
 def load_dispatch_zips(zip_dir, aemo_cdf):
     if not os.path.isdir(zip_dir):
         sys.stderr.write('WARNING: zip file directory %s does not exist\n' % zip_dir)
         return
 
-    files = os.listdir(zip_dir)
-    files.sort()
-    for f in files:
-        if not f.lower().endswith('.zip'): continue
-        if aemo_cdf.have_zipfile_data(f): continue
+    for f in find_new_zips(zip_dir, aemo_cdf):
         rows = load_dispatch_zip(os.path.join(zip_dir, f), aemo_cdf)
+        aemo_cdf.mark_zipfile_loaded(f)
         if rows > 0:
             aemo_cdf.sync()
             print "%s, %d rows" % (f, rows)
@@ -369,13 +699,27 @@ if __name__ == '__main__':
             help='path to generators CSV file [default: PATH/AEMO_GENERATORS.csv]')
     parser.add_argument('-c', '--cdf', metavar='FILE', nargs=1,
             help='path to NetCDF file to write [default: PATH/cdf/dispatch.cdf]')
+    parser.add_argument('-v', '--view-cache', metavar='FILE', nargs=1,
+            help='path to precomputed web app views [default: PATH/cdf/views.csv.gz]')
+    parser.add_argument('-p', '--profile', choices=sorted(CODEC_PROFILES),
+            default=DEFAULT_PROFILE,
+            help='storage codec profile used if a new CDF file is created '
+                 '[default: %s]' % DEFAULT_PROFILE)
 
     # parse command line arguments and fill in default parameters
     args = parser.parse_args()
     if args.generators is None:
         args.generators = os.path.join(args.path_base, 'AEMO_GENERATORS.csv')
+    else:
+        args.generators = args.generators[0]
     if args.cdf is None:
         args.cdf = os.path.join(args.path_base, 'cdf', 'dispatch.cdf')
+    else:
+        args.cdf = args.cdf[0]
+    if args.view_cache is None:
+        args.view_cache = os.path.join(args.path_base, 'cdf', 'views.csv.gz')
+    else:
+        args.view_cache = args.view_cache[0]
 
     # read in generators.csv file
     if os.path.exists(args.generators):
@@ -384,22 +728,55 @@ if __name__ == '__main__':
         generators = []
         sys.stderr.write('WARNING: generator list %s does not exist\n' % args.generators)
 
-    # open (create if necessary) the CDF output file, add in any known
-    # generators not yet present in the CDF
-    cdf = AemoCDF(args.cdf)
-    cdf.add_generators(generators)
-
-    # if the CDF is brand new, look for bulk data from AEMO DVDs
-    if cdf.num_rows() == 0:
-        load_dispatch_dvd_zips(os.path.join(args.path_base, 'dispatch_dvd'), cdf)
-
-    # read in any daily and 5min dispatch zips we haven't seen yet
+    lock = lock_cdf(args.cdf)
     zip_dirs = [os.path.join(args.path_base, 'dispatch_daily'),
                 os.path.join(args.path_base, 'dispatch_5min')]
-    for dir in zip_dirs:
-        load_dispatch_zips(dir, cdf)
 
-    # update daily and 30 min summaries where necessary
-    # TODO: add option to recalculate completely?
-    cdf.update_summaries()
-    cdf.sync()
+    # check the published file for anything to do first, so runs with no
+    # new data don't copy it
+    needs_update = True
+    missing_index = False
+    if os.path.exists(args.cdf):
+        live = AemoCDF(args.cdf, readonly=True)
+        missing_index = live.var_gen_first_active is None
+        needs_update = live.num_rows() == 0 or missing_index or \
+            any(g not in live.gen_id_dict for g in generators) or \
+            any(len(find_new_zips(dir, live)) > 0 for dir in zip_dirs)
+        live.close()
+
+    if needs_update:
+        # open (create if necessary) a working copy of the CDF output file,
+        # add in any known generators not yet present in the CDF
+        work_cdf = begin_update(args.cdf)
+        cdf = AemoCDF(work_cdf, args.profile)
+        ngens = len(cdf.dim_gens)
+        cdf.add_generators(generators)
+
+        # if the CDF is brand new, look for bulk data from AEMO DVDs
+        if cdf.num_rows() == 0:
+            load_dispatch_dvd_zips(os.path.join(args.path_base, 'dispatch_dvd'), cdf)
+
+        # read in any daily and 5min dispatch zips we haven't seen yet
+        for dir in zip_dirs:
+            load_dispatch_zips(dir, cdf)
+
+        # update daily and 30 min summaries where necessary
+        # TODO: add option to recalculate completely?
+        data_changed = len(cdf.dates_changed) > 0
+        cdf.update_summaries()
+
+        # make the new version visible to readers, unless nothing changed
+        changed = data_changed or missing_index or cdf.zips_changed or \
+            len(cdf.dim_gens) != ngens
+        cdf.close()
+        if changed:
+            publish_update(work_cdf, args.cdf)
+        else:
+            discard_update(work_cdf)
+    else:
+        print "No new data"
+
+    # refresh the web app's precomputed default views from the published
+    # file if anything changed
+    refresh_view_cache(args.cdf, args.generators, args.view_cache)
+    lock.close()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python2
+#
+# migrate_cdf.py: rewrite a dispatch CDF file using a different storage
+# codec profile.
+#
+# Copyright (c) 2014 Cameron Patrick <cameron@largestprime.net>
+#
+# This file is part of AusEnergyViz. AusEnergyViz is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, see <http://www.gnu.org/licenses/>.
+
+import netCDF4
+import os
+import sys
+import argparse
+
+from import_aemo import AemoCDF, CODEC_PROFILES, WORK_SUFFIX, lock_cdf, \
+    publish_update, clip_to_storage, refresh_view_cache
+
+# number of time records copied at once; a multiple of the 16 record chunk
+# size so each block covers whole chunks
+COPY_BLOCK = 16*288
+
+def copy_variable(src_var, dst_var):
+    """Copies a variable's contents in blocks along its first dimension."""
+    if len(src_var.dimensions) == 0:
+        dst_var.assignValue(src_var.getValue())
+        return
+    nrows = src_var.shape[0]
+    for start in xrange(0, nrows, COPY_BLOCK):
+        end = min(start + COPY_BLOCK, nrows)
+        dst_var[start:end] = clip_to_storage(dst_var, src_var[start:end])
+
+def migrate_cdf(src_path, dst_path, profile):
+    """Writes a copy of the CDF file at src_path to dst_path, creating the
+    dispatch variables with the given codec profile. Any other variables are
+    copied with their existing settings."""
+    src = netCDF4.Dataset(src_path, 'r')
+    dst = AemoCDF(dst_path, profile)
+
+    for name, dim in src.dimensions.iteritems():
+        if name not in dst.root.dimensions:
+            dst.root.createDimension(name, None if dim.isunlimited() else len(dim))
+
+    for name, src_var in src.variables.iteritems():
+        if name not in dst.root.variables:
+            filters = src_var.filters() or {}
+            chunking = src_var.chunking()
+            dst.root.createVariable(name, src_var.dtype, src_var.dimensions,
+                                    zlib=filters.get('zlib', False),
+                                    complevel=filters.get('complevel') or 4,
+                                    shuffle=filters.get('shuffle', False),
+                                    chunksizes=None if chunking == 'contiguous' else chunking,
+                                    fill_value=getattr(src_var, '_FillValue', None))
+        dst_var = dst.root.variables[name]
+        for attr in src_var.ncattrs():
+            if attr not in ('_FillValue', 'scale_factor', 'add_offset') \
+                    and attr not in dst_var.ncattrs():
+                dst_var.setncattr(attr, src_var.getncattr(attr))
+        sys.stderr.write("Copying %s %s\n" % (name, src_var.shape))
+        copy_variable(src_var, dst_var)
+        dst.sync()
+
+    for attr in src.ncattrs():
+        if attr != 'codec_profile':
+            dst.root.setncattr(attr, src.getncattr(attr))
+
+    # files from before the generator activity index need one built
+    dst.load_start_date()
+    dst.update_gen_id_dict()
+    dst.load_activity_index()
+    if 'gen_first_active' not in src.variables:
+        dst.rebuild_activity_index()
+
+    src.close()
+    dst.close()
+
+if __name__ == '__main__':
+    # set up argument parser
+    parser = argparse.ArgumentParser(description='Rewrite a dispatch CDF file with a different codec profile.')
+    parser.add_argument('path_base', metavar='PATH',
+            help='base directory containing downloaded data')
+    parser.add_argument('-p', '--profile', choices=sorted(CODEC_PROFILES), required=True,
+            help='storage codec profile for the rewritten file')
+    parser.add_argument('-c', '--cdf', metavar='FILE',
+            help='path to NetCDF file to read [default: PATH/cdf/dispatch.cdf]')
+    parser.add_argument('-o', '--output', metavar='FILE',
+            help='path to write the new file to [default: replace the input file]')
+    parser.add_argument('-g', '--generators', metavar='FILE',
+            help='path to generators CSV file [default: PATH/AEMO_GENERATORS.csv]')
+    parser.add_argument('-v', '--view-cache', metavar='FILE',
+            help='path to precomputed web app views, rebuilt when the input '
+                 'file is replaced [default: PATH/cdf/views.csv.gz]')
+
+    # parse command line arguments and fill in default parameters
+    args = parser.parse_args()
+    if args.cdf is None:
+        args.cdf = os.path.join(args.path_base, 'cdf', 'dispatch.cdf')
+    if args.generators is None:
+        args.generators = os.path.join(args.path_base, 'AEMO_GENERATORS.csv')
+    if args.view_cache is None:
+        args.view_cache = os.path.join(args.path_base, 'cdf', 'views.csv.gz')
+    if not os.path.exists(args.cdf):
+        sys.stderr.write('ERROR: CDF file %s does not exist\n' % args.cdf)
+        sys.exit(1)
+
+    # write to a working copy of the destination, then publish it so a failed
+    # migration never leaves a half-written file behind and readers of the
+    # old file are undisturbed
+    dst_path = args.output if args.output is not None else args.cdf
+    lock = lock_cdf(dst_path)
+    tmp_path = dst_path + WORK_SUFFIX
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    src_size = os.path.getsize(args.cdf)
+    migrate_cdf(args.cdf, tmp_path, args.profile)
+    publish_update(tmp_path, dst_path)
+    # lossy and fixed point profiles change the stored values, so the
+    # web app's views need recomputing from the new file
+    if args.output is None:
+        refresh_view_cache(dst_path, args.generators, args.view_cache)
+    lock.close()
+
+    sys.stderr.write("%s: %d bytes -> %s: %d bytes (%s)\n" % (
+        args.cdf, src_size, dst_path, os.path.getsize(dst_path), args.profile))
@@ -0,0 +1,62 @@
+#
+# nemdata.py: definitions shared by the import, export and view cache
+# scripts, mirroring those in the R package.
+#
+# Copyright (c) 2014 Cameron Patrick <cameron@largestprime.net>
+#
+# This file is part of AusEnergyViz. AusEnergyViz is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, see <http://www.gnu.org/licenses/>.
+
+# minutes per record for each timescale
+TIMESCALE_MINUTES = {'5min': 5, '30min': 30, 'daily': 24*60}
+
+# regions and fuel types known to the R package (see nemdata_fetch_info)
+REGIONS = ['VIC', 'NSW', 'QLD', 'SA', 'TAS']
+FUELS = ['Coal', 'Gas', 'Hydro', 'Wind', 'Other']
+
+def interpret_fuel(ft):
+    """Maps a fuel source descriptor to one of FUELS, as interpret_fuel()
+    in the R package does. Note that R's grep() there uses the descriptor as
+    the pattern, so only plain "Natural Gas" matches and mixed descriptors
+    such as "Natural Gas / Fuel Oil" end up as Other."""
+    if ft == 'Natural Gas' or ft == 'Coal Seam Methane':
+        return 'Gas'
+    elif ft in ('Black Coal', 'Brown Coal', 'Coal Tailings'):
+        return 'Coal'
+    elif ft == 'Water':
+        return 'Hydro'
+    elif ft == 'Wind':
+        return 'Wind'
+    else:
+        return 'Other'
+
+def read_generator_groups(path):
+    """Returns a dict mapping each DUID in the generators CSV file to a
+    (region, fuel) tuple. Generators outside the known regions are left out,
+    as they are from the web app's plots."""
+    groups = {}
+    f = file(path, 'rb')
+    text = f.read()
+    f.close()
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    for line in text.split('\n')[1:]:
+        fields = line.strip().split(',')
+        if len(fields) < 17: continue
+        id = fields[13]
+        if id == '-': continue
+        region = fields[2]
+        if region.endswith('1'):
+            region = region[:-1]
+        if region not in REGIONS: continue
+        groups[id] = (region, interpret_fuel(fields[7]))
+    return groups
@@ -0,0 +1,134 @@
+#
+# view_cache.py: precompute the web app's default views from the dispatch CDF.
+#
+# Copyright (c) 2014 Cameron Patrick <cameron@largestprime.net>
+#
+# This file is part of AusEnergyViz. AusEnergyViz is free software: you can
+# redistribute it and/or modify it under the terms of the GNU General Public
+# License as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import numpy
+import datetime
+import os
+import sys
+import shutil
+
+from nemdata import TIMESCALE_MINUTES, REGIONS, FUELS, read_generator_groups
+
+# Default views, in priority order: (name, number of days ending on the last
+# day of data, timescale). The timescales match the "auto" resolution the
+# web app picks for each span, and the first entry is the app's initial view.
+VIEW_RANGES = [
+    ('week', 7, '30min'),
+    ('day', 1, '5min'),
+    ('month', 30, 'daily'),
+]
+
+# views that would take the (uncompressed) cache past this size are dropped;
+# all of VIEW_RANGES with every region and fuel series come to about 160 KB
+VIEW_CACHE_MAX_BYTES = 256*1024
+
+def group_matrix(cdf, generator_groups):
+    """Returns a list of (region, fuel) keys and a (gens x keys) 0/1 matrix
+    so that dispatch data multiplied by the matrix gives totals per key."""
+    keys = [(r, f) for r in REGIONS for f in FUELS]
+    key_index = dict((k, i) for i, k in enumerate(keys))
+    matrix = numpy.zeros((len(cdf.dim_gens), len(keys)), 'f8')
+    for gen_id, i in cdf.gen_id_dict.iteritems():
+        if gen_id in generator_groups:
+            matrix[i, key_index[generator_groups[gen_id]]] = 1
+    return keys, matrix
+
+def view_records(cdf, first_date, last_date, timescale):
+    """Returns the (first, last) record numbers the web app would read for
+    a date range, mirroring nemdata_fetch_dispatch's rounding and clamping,
+    or None if there are fewer than two."""
+    var = cdf.root.variables['dispatch_' + timescale]
+    nrows = var.shape[0]
+    step = TIMESCALE_MINUTES[timescale]
+    def record_num(dt):
+        delta = dt - cdf.start_date
+        minutes = delta.days*24*60 + delta.seconds/60.0
+        return min(max(int(round(minutes / step)), 0), nrows - 1)
+    first = record_num(datetime.datetime.combine(first_date, datetime.time(0, 0)))
+    last = record_num(datetime.datetime.combine(last_date, datetime.time(23, 55)))
+    if last - first + 1 < 2:
+        return None
+    return (first, last)
+
+def format_view(cdf, name, first_date, last_date, timescale, keys, matrix):
+    """Returns the lines for one view: a "#view,name,timescale,start,finish"
+    line, then a CSV table with a time column and one REGION.FUEL column per
+    series, leaving out series that are zero throughout."""
+    records = view_records(cdf, first_date, last_date, timescale)
+    if records is None:
+        return ''
+    first, last = records
+    var = cdf.root.variables['dispatch_' + timescale]
+    # only read generators with output somewhere in the range
+    per_record = TIMESCALE_MINUTES[timescale] // 5
+    active = cdf.active_generators(first*per_record, (last + 1)*per_record - 1)
+    data = cdf.read_active_columns(var, first, last + 1, active)
+    totals = numpy.dot(numpy.ma.filled(data, 0), matrix[active])
+    series = numpy.nonzero(numpy.any(totals != 0, axis=0))[0]
+    if len(series) == 0:
+        return ''
+    step = datetime.timedelta(minutes=TIMESCALE_MINUTES[timescale])
+    lines = ['#view,%s,%s,%s,%s\n' % (name, timescale, first_date.isoformat(),
+                                      last_date.isoformat()),
+             'time,%s\n' % ','.join('%s.%s' % keys[k] for k in series)]
+    for r in xrange(totals.shape[0]):
+        time = cdf.start_date + (first + r)*step
+        lines.append('%s,%s\n' % (time.strftime('%Y-%m-%d %H:%M'),
+                                   ','.join(['%.1f' % v for v in totals[r, series]])))
+    return ''.join(lines)
+
+def update_view_cache(cdf, generator_groups, path, max_bytes=VIEW_CACHE_MAX_BYTES):
+    """Writes pre-aggregated totals per region and fuel type for each of
+    VIEW_RANGES to a gzipped file, one block per view (see format_view). The
+    file is written to a temporary
+    name and renamed into place, so readers see either the old or the new
+    cache, and entries from earlier runs are never carried over; it keeps
+    the old file's permissions and (where allowed) group. Views that
+    would take the cache past max_bytes are left out, so the ones earliest
+    in VIEW_RANGES are kept."""
+    if cdf.start_date is None or cdf.num_rows() == 0:
+        return
+
+    last_date = cdf.time_for_record_num(cdf.num_rows() - 1).date()
+    keys, matrix = group_matrix(cdf, generator_groups)
+
+    size = 0
+    entries = []
+    for name, days, timescale in VIEW_RANGES:
+        first_date = last_date - datetime.timedelta(days=days - 1)
+        text = format_view(cdf, name, first_date, last_date, timescale, keys, matrix)
+        if size + len(text) > max_bytes:
+            sys.stderr.write('WARNING: dropping view %s from cache, size limit reached\n' % name)
+            continue
+        size += len(text)
+        entries.append(text)
+
+    tmp_path = path + '.tmp'
+    f = gzip.open(tmp_path, 'wb')
+    for text in entries:
+        f.write(text)
+    f.close()
+    if os.path.exists(path):
+        shutil.copymode(path, tmp_path)
+        try:
+            os.chown(tmp_path, -1, os.stat(path).st_gid)
+        except OSError:
+            sys.stderr.write('WARNING: could not set group of %s\n' % tmp_path)
+    os.rename(tmp_path, path)
+    print "Wrote view cache %s (%d views)" % (path, len(entries))
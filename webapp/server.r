@@ -233,6 +233,19 @@ shinyServer(function(input, output) {
         gens <- generatorList()
         time_info <- timeInfo()
         group_by <- groupBy()
+
+        # default views are precomputed by the importer, so use those
+        # rather than reading every generator from the CDF when we can
+        if (length(input$regions) == 0 && length(input$fuels) == 0 &&
+            is.null(time_info$aggregate_timescale)) {
+            df <- nemdata_fetch_view(nd, time_info$start, time_info$finish, time_info$timescale)
+            if (!is.null(df)) {
+                df <- df[,list(output=sum(output)),by=c("time", input$split_by, group_by)]
+                df$output <- df$output / 1000
+                return(data.frame(df))
+            }
+        }
+
         df <- rawDispatchData()
         if (is.null(df)) {
             return(NULL)